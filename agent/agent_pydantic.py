@@ -1,21 +1,33 @@
 from __future__ import annotations as _annotations
 import os
+import asyncio
+import calendar
 from dataclasses import dataclass
+from functools import lru_cache
 from dotenv import load_dotenv
-from typing import List
+from typing import TYPE_CHECKING, List, Literal, Optional
 
 from pydantic_ai import Agent, RunContext
-from pydantic_ai.models.openai import OpenAIModel
-from openai import AsyncOpenAI
-from fastembed.embedding import TextEmbedding
-from supabase import Client
+
+from agent.context import assemble_context
+
+# Bibliotecas pesadas (fastembed, supabase, openai) são importadas sob demanda
+if TYPE_CHECKING:
+    from fastembed import TextEmbedding
+    from openai import AsyncOpenAI
+    from supabase import Client
 
 # Carregar variáveis de ambiente
 load_dotenv()
 
 # Configuração do modelo LLM
 llm = os.getenv("LLM_MODEL", "gpt-4o-mini")
-model = OpenAIModel(llm)
+
+# Modelo de embeddings das consultas (o mesmo usado na ingestão)
+EMBED_MODEL_ID = "sentence-transformers/paraphrase-multilingual-mpnet-base-v2"
+
+# Quantidade de candidatos buscados no Supabase antes da montagem do contexto
+MATCH_COUNT = int(os.getenv("MATCH_COUNT", "20"))
 
 # Dependências do agente
 @dataclass
@@ -23,6 +35,14 @@ class CRMAgentDeps:
     supabase: Client
     openai_client: AsyncOpenAI
 
+def init_deps() -> CRMAgentDeps:
+    import clients
+
+    return CRMAgentDeps(
+        supabase=clients.new_supabase_client(),
+        openai_client=clients.new_client_openai()
+    )
+
 SYSTEM_PROMPT = """
 Você é um especialista em análise de relatórios CRM.
 Sua função é:
@@ -32,22 +52,43 @@ Sua função é:
 - Sugerir oportunidades de melhoria e recomendações práticas
 
 Use sempre os relatórios armazenados no Supabase como base para sua resposta.
+Para totais, médias, comparações e tendências de indicadores, prefira as ferramentas de métricas
+(list_crm_metrics e query_crm_metrics) em vez de somar números dos trechos de texto.
 Se não encontrar informação suficiente, seja honesto e diga isso.
 """
 
+# Modelo LLM (OpenAI Chat Completions) passado em cada execução do agente.
+# Usa o client das dependências, para existir um único pool de conexões gerenciado por quem criou os deps.
+def build_model(openai_client: AsyncOpenAI):
+    from pydantic_ai.providers.openai import OpenAIProvider
+    try:
+        from pydantic_ai.models.openai import OpenAIChatModel
+    except ImportError:  # pydantic-ai < 1.0
+        from pydantic_ai.models.openai import OpenAIModel as OpenAIChatModel
+
+    return OpenAIChatModel(llm, provider=OpenAIProvider(openai_client=openai_client))
+
 # Criar o agente
 crm_expert_agent = Agent(
-    model=model,
     system_prompt=SYSTEM_PROMPT,
     deps_type=CRMAgentDeps,
     retries=2
 )
 
+# Modelo de embeddings carregado uma única vez por processo.
+# EMBEDDING_THREADS=1 é necessário quando o modelo é carregado antes do fork (preload),
+# pois o pool de threads do onnxruntime não é herdado pelos processos filhos.
+@lru_cache(maxsize=1)
+def get_embedding_model() -> TextEmbedding:
+    from fastembed import TextEmbedding
+
+    threads = os.getenv("EMBEDDING_THREADS")
+    return TextEmbedding(EMBED_MODEL_ID, threads=int(threads) if threads else None)
+
 # Gerar os embeddings de consultas
 def get_embedding(text: str) -> List[float]:
     try:
-        EMBED_MODEL_ID = "sentence-transformers/paraphrase-multilingual-mpnet-base-v2"
-        embedding_model = TextEmbedding(EMBED_MODEL_ID)
+        embedding_model = get_embedding_model()
         embeddings = list(embedding_model.passage_embed([text]))
         return embeddings[0].tolist()
     except Exception as e:
@@ -61,33 +102,116 @@ async def retrieve_relevant_reports(ctx: RunContext[CRMAgentDeps], user_query: s
     Recupera os trechos mais relevantes de relatórios CRM para responder a uma query.
     """
     try:
-        # Gerar embedding da query
-        query_embedding = get_embedding(user_query)
+        # Gerar embedding da query (chamadas síncronas rodam fora do event loop)
+        query_embedding = await asyncio.to_thread(get_embedding, user_query)
 
-        # Buscar no Supabase os chunks mais relevantes
-        result = ctx.deps.supabase.rpc(
+        # Buscar no Supabase os chunks candidatos
+        result = await asyncio.to_thread(ctx.deps.supabase.rpc(
             "match_reports_crm",
             {
                 "query_embedding": query_embedding,
-                "match_count": 5
+                "match_count": MATCH_COUNT
             }
-        ).execute()
+        ).execute)
 
         if not result.data:
             return "Nenhum dado relevante encontrado."
 
-        # Formatar chunks encontrados
-        context = []
-        for doc in result.data:
-            chunk = f"""
-# {doc['metadata']['source']} - Chunk {doc['metadata']['chunk_index']}
+        # Remover duplicatas, diversificar e limitar o contexto ao orçamento de tokens
+        # (parse dos embeddings e tokenização são CPU, feitos fora do event loop)
+        return await asyncio.to_thread(assemble_context, result.data, model_name=llm)
 
-{doc['content']}
-"""
-            context.append(chunk)
+    except Exception as e:
+        print(f"Erro ao buscar relatórios: {e}")
+        return f"Erro: {str(e)}"
+
+# Converte "AAAA-MM" (ou "AAAA-MM-DD") no primeiro/último dia do mês
+def month_bound(value: Optional[str], end: bool = False) -> Optional[str]:
+    if not value:
+        return None
+    year, month = int(value[:4]), int(value[5:7])
+    day = calendar.monthrange(year, month)[1] if end else 1
+    return f"{year:04d}-{month:02d}-{day:02d}"
+
+# Formata linhas retornadas pelo Supabase como tabela markdown
+def format_rows(rows: List[dict], columns: List[str]) -> str:
+    lines = [
+        "| " + " | ".join(columns) + " |",
+        "|" + "---|" * len(columns)
+    ]
+    for row in rows:
+        values = ["" if row.get(col) is None else str(row.get(col)) for col in columns]
+        lines.append("| " + " | ".join(values) + " |")
+    return "\n".join(lines)
+
+# Ferramenta que lista as métricas extraídas das tabelas dos relatórios
+@crm_expert_agent.tool
+async def list_crm_metrics(ctx: RunContext[CRMAgentDeps], granularity: Literal["mensal", "semanal"] = "mensal") -> str:
+    """
+    Lista as métricas disponíveis (extraídas das tabelas dos relatórios CRM) com unidade e períodos cobertos.
 
-        return "\n\n---\n\n".join(context)
+    Args:
+        granularity: "mensal" para relatórios mensais ou "semanal" para relatórios semanais.
+    """
+    try:
+        result = await asyncio.to_thread(ctx.deps.supabase.rpc(
+            "list_crm_metrics",
+            {"granularity_filter": granularity}
+        ).execute)
+
+        if not result.data:
+            return "Nenhuma métrica encontrada."
+
+        return format_rows(result.data, ["metric", "unit", "first_period", "last_period", "n"])
 
     except Exception as e:
-        print(f"Erro ao buscar relatórios: {e}")
-        return f"Erro: {str(e)}"
\ No newline at end of file
+        print(f"Erro ao listar métricas: {e}")
+        return f"Erro: {str(e)}"
+
+# Ferramenta que responde perguntas agregadas e de tendência em uma única consulta
+@crm_expert_agent.tool
+async def query_crm_metrics(
+    ctx: RunContext[CRMAgentDeps],
+    metric: str,
+    dimension: Optional[str] = None,
+    period_start: Optional[str] = None,
+    period_end: Optional[str] = None,
+    aggregation: Literal["sum", "avg", "min", "max", "count"] = "sum",
+    group_by: Literal["period", "dimension", "period_dimension", "total"] = "period",
+    granularity: Literal["mensal", "semanal"] = "mensal"
+) -> str:
+    """
+    Agrega métricas das tabelas dos relatórios CRM (negociações, vendas, tarefas, funil, motivos de perda, metas).
+
+    Args:
+        metric: trecho do nome da métrica, sem diferenciar acentos/maiúsculas. Os nomes seguem
+            "<tabela> - <coluna> por <dimensão>" (ex.: "Negociações - Quantidade por Etapa"); use list_crm_metrics para vê-los.
+        dimension: trecho da dimensão/linha da tabela (ex.: nome do vendedor, etapa do funil, motivo de perda).
+        period_start: mês inicial no formato AAAA-MM.
+        period_end: mês final no formato AAAA-MM.
+        aggregation: função de agregação dos valores.
+        group_by: "period" para série mensal, "dimension" para ranking, "period_dimension" para ambos, "total" para um único valor.
+        granularity: "mensal" para relatórios mensais ou "semanal" para relatórios semanais.
+    """
+    try:
+        result = await asyncio.to_thread(ctx.deps.supabase.rpc(
+            "aggregate_crm_metrics",
+            {
+                "metric_pattern": metric,
+                "dimension_pattern": dimension,
+                "period_start": month_bound(period_start),
+                "period_end": month_bound(period_end, end=True),
+                "granularity_filter": granularity,
+                "aggregation": aggregation,
+                "group_by": group_by
+            }
+        ).execute)
+
+        if not result.data:
+            return "Nenhuma métrica encontrada. Use list_crm_metrics para ver os nomes disponíveis."
+
+        return format_rows(result.data, ["period", "metric", "dimension", "value", "n"])
+
+    except Exception as e:
+        print(f"Erro ao consultar métricas: {e}")
+        return f"Erro: {str(e)}"
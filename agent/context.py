@@ -0,0 +1,252 @@
+"""
+Montagem do contexto enviado ao LLM a partir dos chunks recuperados no Supabase.
+
+Etapas:
+- remove duplicatas (relatórios re-ingeridos ou chunks sobrepostos): texto idêntico ou embeddings
+  quase iguais dentro do mesmo período
+- seleciona os chunks com MMR, penalizando redundância entre fontes e meses
+- junta chunks vizinhos (chunk_index consecutivos) da mesma fonte
+- corta o resultado em um orçamento de tokens medido com o tokenizer do modelo
+"""
+from __future__ import annotations
+import os
+import re
+import json
+import threading
+from functools import lru_cache
+from typing import Any, Dict, List, Optional
+
+import numpy as np
+
+# Parâmetros de montagem do contexto
+CONTEXT_MAX_TOKENS = int(os.getenv("CONTEXT_MAX_TOKENS", "3000"))
+CONTEXT_TOP_K = int(os.getenv("CONTEXT_TOP_K", "8"))
+DEDUP_THRESHOLD = float(os.getenv("CONTEXT_DEDUP_THRESHOLD", "0.95"))
+MMR_LAMBDA = float(os.getenv("CONTEXT_MMR_LAMBDA", "0.7"))
+
+# Peso da penalidade por mesma fonte / mesmo mês na redundância do MMR
+GROUP_WEIGHT = 0.3
+
+# Abaixo disso não vale a pena incluir um bloco truncado
+MIN_TRUNCATED_TOKENS = 64
+
+PERIOD_RE = re.compile(r'(?P<year>\d{4})\.(?P<month>\d{2})')
+
+
+_encoding_lock = threading.Lock()
+
+# Tokenizer do modelo LLM (tiktoken). Sem tiktoken, ou se o arquivo BPE não puder ser
+# baixado (ambiente sem rede), usa aproximação de ~4 caracteres por token.
+# O lock evita que várias threads tentem baixar o arquivo ao mesmo tempo no cold start.
+@lru_cache(maxsize=None)
+def _load_encoding(model_name: str):
+    try:
+        import tiktoken
+    except ImportError:
+        return None
+
+    try:
+        try:
+            return tiktoken.encoding_for_model(model_name)
+        except KeyError:
+            return tiktoken.get_encoding("o200k_base")
+    except Exception as e:
+        print(f"Erro ao carregar tokenizer, usando aproximação: {e}")
+        return None
+
+def _get_encoding(model_name: str):
+    with _encoding_lock:
+        return _load_encoding(model_name)
+
+def load_tokenizer(model_name: str):
+    """
+    Carrega o tokenizer antecipadamente (no startup da aplicação), fora do caminho das requisições.
+    """
+    _get_encoding(model_name)
+
+def count_tokens(text: str, model_name: str) -> int:
+    encoding = _get_encoding(model_name)
+    if encoding is None:
+        return (len(text) + 3) // 4
+    return len(encoding.encode(text))
+
+def truncate_to_tokens(text: str, max_tokens: int, model_name: str) -> str:
+    encoding = _get_encoding(model_name)
+    if encoding is None:
+        return text[:max_tokens * 4]
+    return encoding.decode(encoding.encode(text)[:max_tokens])
+
+# O PostgREST devolve o tipo vector como string "[0.1,0.2,...]"
+def parse_embedding(value: Any) -> Optional[np.ndarray]:
+    if value is None:
+        return None
+    if isinstance(value, str):
+        value = json.loads(value)
+    vector = np.asarray(value, dtype=np.float32)
+    norm = np.linalg.norm(vector)
+    if norm == 0:
+        return None
+    return vector / norm
+
+def report_period(source: str) -> Optional[str]:
+    """
+    Extrai o mês do relatório (AAAA.MM) a partir do nome do arquivo.
+    """
+    m = PERIOD_RE.search(source or "")
+    if not m:
+        return None
+    return f"{m.group('year')}.{m.group('month')}"
+
+def _prepare(docs: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    prepared = []
+    for doc in docs:
+        metadata = doc.get('metadata') or {}
+        source = metadata.get('source', '')
+        prepared.append({
+            "content": doc.get('content') or "",
+            "source": source,
+            "chunk_index": metadata.get('chunk_index', 0),
+            "period": report_period(source),
+            "similarity": float(doc.get('similarity') or 0.0),
+            "embedding": parse_embedding(doc.get('embedding')),
+        })
+    # Ordem de relevância decrescente
+    prepared.sort(key=lambda d: d["similarity"], reverse=True)
+    return prepared
+
+def _normalized_text(doc: Dict[str, Any]) -> str:
+    return re.sub(r'\s+', ' ', doc["content"]).strip().lower()
+
+def _cosine(a: Dict[str, Any], b: Dict[str, Any]) -> float:
+    if a["embedding"] is None or b["embedding"] is None:
+        # Sem embedding, só texto idêntico conta como similar
+        return 1.0 if _normalized_text(a) == _normalized_text(b) else 0.0
+    return float(np.dot(a["embedding"], b["embedding"]))
+
+def _same_report(a: Dict[str, Any], b: Dict[str, Any]) -> bool:
+    if a["period"] is not None and b["period"] is not None:
+        return a["period"] == b["period"]
+    return os.path.splitext(a["source"])[0].lower() == os.path.splitext(b["source"])[0].lower()
+
+def _is_duplicate(a: Dict[str, Any], b: Dict[str, Any], threshold: float) -> bool:
+    # Os relatórios seguem o mesmo template: a mesma seção em meses diferentes muda quase só
+    # nos números, que os embeddings mal captam. Por isso a similaridade só conta como duplicata
+    # dentro do mesmo período (re-ingestão/sobreposição); entre períodos, quem trata é o MMR.
+    if _normalized_text(a) == _normalized_text(b):
+        return True
+    return _same_report(a, b) and _cosine(a, b) >= threshold
+
+def deduplicate(docs: List[Dict[str, Any]], threshold: float = DEDUP_THRESHOLD) -> List[Dict[str, Any]]:
+    """
+    Mantém apenas o chunk mais relevante de cada grupo de duplicatas: texto idêntico, ou
+    embeddings quase iguais no mesmo período/relatório.
+    """
+    kept: List[Dict[str, Any]] = []
+    for doc in docs:
+        if not any(_is_duplicate(doc, other, threshold) for other in kept):
+            kept.append(doc)
+    return kept
+
+def _redundancy(a: Dict[str, Any], b: Dict[str, Any]) -> float:
+    if a["source"] == b["source"]:
+        group = 1.0
+    elif a["period"] is not None and a["period"] == b["period"]:
+        group = 0.5
+    else:
+        group = 0.0
+    return (1 - GROUP_WEIGHT) * _cosine(a, b) + GROUP_WEIGHT * group
+
+def mmr_select(docs: List[Dict[str, Any]], top_k: int = CONTEXT_TOP_K, lambda_: float = MMR_LAMBDA) -> List[Dict[str, Any]]:
+    """
+    Maximal Marginal Relevance: equilibra relevância para a query e diversidade de fontes/meses.
+    """
+    candidates = list(docs)
+    selected: List[Dict[str, Any]] = []
+    while candidates and len(selected) < top_k:
+        best = max(
+            candidates,
+            key=lambda d: lambda_ * d["similarity"]
+            - (1 - lambda_) * max((_redundancy(d, s) for s in selected), default=0.0)
+        )
+        selected.append(best)
+        candidates.remove(best)
+    return selected
+
+def merge_adjacent(docs: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    """
+    Junta chunks consecutivos da mesma fonte em um único bloco, preservando a ordem do MMR.
+    """
+    rank = {id(doc): i for i, doc in enumerate(docs)}
+    by_source: Dict[str, List[Dict[str, Any]]] = {}
+    for doc in docs:
+        by_source.setdefault(doc["source"], []).append(doc)
+
+    blocks = []
+    for source, items in by_source.items():
+        items.sort(key=lambda d: d["chunk_index"])
+        run = [items[0]]
+        for doc in items[1:]:
+            if doc["chunk_index"] == run[-1]["chunk_index"] + 1:
+                run.append(doc)
+            else:
+                blocks.append(run)
+                run = [doc]
+        blocks.append(run)
+
+    blocks.sort(key=lambda run: min(rank[id(d)] for d in run))
+
+    merged = []
+    for run in blocks:
+        first, last = run[0]["chunk_index"], run[-1]["chunk_index"]
+        label = f"Chunk {first}" if first == last else f"Chunks {first}-{last}"
+        merged.append({
+            "source": run[0]["source"],
+            "label": label,
+            "content": "\n\n".join(d["content"].strip() for d in run),
+        })
+    return merged
+
+def _format_block(block: Dict[str, Any], content: str) -> str:
+    return f"""
+# {block['source']} - {block['label']}
+
+{content}
+"""
+
+def assemble_context(
+    docs: List[Dict[str, Any]],
+    model_name: str,
+    max_tokens: int = CONTEXT_MAX_TOKENS,
+    top_k: int = CONTEXT_TOP_K,
+) -> str:
+    """
+    Monta o contexto final a partir dos registros retornados por match_reports_crm.
+    """
+    separator = "\n\n---\n\n"
+    separator_tokens = count_tokens(separator, model_name)
+
+    selected = mmr_select(deduplicate(_prepare(docs)), top_k=top_k)
+
+    context = []
+    used = 0
+    for block in merge_adjacent(selected):
+        text = _format_block(block, block["content"])
+        cost = count_tokens(text, model_name) + (separator_tokens if context else 0)
+
+        if used + cost <= max_tokens:
+            context.append(text)
+            used += cost
+            continue
+
+        # Trunca o último bloco que cabe parcialmente e encerra
+        header_tokens = count_tokens(_format_block(block, ""), model_name)
+        remaining = max_tokens - used - header_tokens - (separator_tokens if context else 0)
+        # O primeiro bloco sempre entra (mesmo além do orçamento), para o contexto nunca ficar vazio
+        if not context:
+            remaining = max(remaining, MIN_TRUNCATED_TOKENS)
+        if remaining >= MIN_TRUNCATED_TOKENS:
+            content = truncate_to_tokens(block["content"], remaining, model_name)
+            context.append(_format_block(block, content))
+        break
+
+    return separator.join(context)
@@ -11,5 +11,7 @@ Sua função é:
 - Sugerir oportunidades de melhoria e recomendações práticas
 
 Use sempre os relatórios armazenados no Supabase como base para sua resposta.
+Para totais, médias, comparações e tendências de indicadores, prefira as ferramentas de métricas
+(list_crm_metrics e query_crm_metrics) em vez de somar números dos trechos de texto.
 Se não encontrar informação suficiente, seja honesto e diga isso.
 """
\ No newline at end of file
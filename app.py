@@ -1,28 +1,108 @@
-from fastapi import FastAPI
-from pydantic import BaseModel
+import os
+import asyncio
+from contextlib import asynccontextmanager
+from typing import Callable, Optional
 
-import clients
-from agent.agent_pydantic import crm_expert_agent, CRMAgentDeps
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse
+from pydantic import BaseModel
 
-# Inicializar FastAPI
-app = FastAPI(title="CRM Expert Agent API", version=0.1)
+# Tempo máximo da consulta ao Supabase no readiness (segundos)
+READINESS_TIMEOUT = float(os.getenv("READINESS_TIMEOUT", "2"))
 
 # Modelo para requisição
 class QueryRequest(BaseModel):
     query: str
 
-# Criar instâncias de dependências do agente
-supabase = clients.new_supabase_client()
+def preload_embedding_model():
+    """
+    Carrega o modelo de embeddings no processo atual.
+
+    Chamado no master do gunicorn (preload_app) antes do fork, para que os workers
+    compartilhem a memória do modelo via copy-on-write.
+    """
+    from agent import agent_pydantic
+
+    agent_pydantic.get_embedding_model()
+
+def create_app(deps_factory: Optional[Callable] = None) -> FastAPI:
+    """
+    Cria a aplicação FastAPI. Clientes e recursos pesados são criados no lifespan,
+    e não na importação do módulo.
+    """
+
+    @asynccontextmanager
+    async def lifespan(app: FastAPI):
+        from agent import agent_pydantic
+        from agent.context import load_tokenizer
+
+        app.state.ready = False
+        app.state.agent = agent_pydantic.crm_expert_agent
+
+        # Criar instâncias de dependências do agente; o modelo usa o mesmo client OpenAI
+        app.state.deps = (deps_factory or agent_pydantic.init_deps)()
+        app.state.model = agent_pydantic.build_model(app.state.deps.openai_client)
+
+        # Carregar o modelo de embeddings fora do event loop (no-op se já foi pré-carregado)
+        await asyncio.to_thread(agent_pydantic.get_embedding_model)
+
+        # Carregar o tokenizer usado na montagem do contexto (pode baixar o arquivo BPE)
+        await asyncio.to_thread(load_tokenizer, agent_pydantic.llm)
+
+        app.state.ready = True
+        yield
+        app.state.ready = False
+
+        openai_client = getattr(app.state.deps, "openai_client", None)
+        if openai_client is not None:
+            await openai_client.close()
+
+    # Inicializar FastAPI
+    app = FastAPI(title="CRM Expert Agent API", version="0.1", lifespan=lifespan)
+
+    @app.get("/health/live")
+    async def liveness():
+        return {"status": "ok"}
+
+    @app.get("/health/ready")
+    async def readiness(request: Request):
+        """
+        Pronto quando a aplicação não está em shutdown e o Supabase responde a uma consulta
+        mínima dentro de READINESS_TIMEOUT segundos. (Durante o startup o uvicorn ainda não
+        atende requisições, então a verificação útil aqui é a do Supabase.)
+        """
+        if not getattr(request.app.state, "ready", False):
+            return JSONResponse(status_code=503, content={"status": "shutting down"})
+
+        supabase = request.app.state.deps.supabase
+        try:
+            await asyncio.wait_for(
+                asyncio.to_thread(supabase.table("reports_crm").select("id").limit(1).execute),
+                timeout=READINESS_TIMEOUT
+            )
+        except Exception as e:
+            return JSONResponse(
+                status_code=503,
+                content={"status": "unavailable", "supabase": str(e) or type(e).__name__}
+            )
+        return {"status": "ready"}
+
+    @app.post("/ask")
+    async def ask_agent(request: Request, query: QueryRequest):
+        try:
+            # Rodar agente passando a query e as dependências
+            result = await request.app.state.agent.run(
+                query.query,
+                model=request.app.state.model,
+                deps=request.app.state.deps
+            )
+            return {"answer": result.output}
+        except Exception as e:
+            return {"error": str(e)}
 
-openai_client = clients.new_client_openai()
+    return app
 
-deps = CRMAgentDeps(supabase=supabase, openai_client=openai_client)
+if os.getenv("PRELOAD_EMBEDDING_MODEL") == "1":
+    preload_embedding_model()
 
-@app.post("/ask")
-async def ask_agent(request: QueryRequest):
-    try:
-        # Rodar agente passando a query e as dependências
-        result = await crm_expert_agent.run(request.query, deps=deps)
-        return {"answer": result.output}
-    except Exception as e:
-        return {"error": str(e)}
\ No newline at end of file
+app = create_app()
@@ -1,7 +1,5 @@
 import os
 import requests
-from supabase import create_client, Client
-from openai import AsyncOpenAI
 from dotenv import load_dotenv
 
 load_dotenv()
@@ -32,6 +30,8 @@ def get_access_token():
 
 # Client Supabase
 def new_supabase_client():
+    from supabase import create_client, Client
+
     url: str = os.environ.get("SUPABASE_URL")
     key: str = os.environ.get("SUPABASE_KEY")
     
@@ -41,6 +41,8 @@ def new_supabase_client():
 
 # Cliente OpenAI
 def new_client_openai():
+    from openai import AsyncOpenAI
+
     openai_api_key: str = os.environ.get('OPENAI_API_KEY')
 
     openai_client = AsyncOpenAI(api_key=openai_api_key)
@@ -0,0 +1,125 @@
+"""
+Cache em disco dos DoclingDocuments convertidos, compartilhado por pipeline/ingestion.py e
+v1_local/pipeline/transform.py.
+
+A chave é o hash do conteúdo do arquivo + as opções do conversor/pipeline + a versão do docling,
+então mudar MAX_TOKENS ou o tokenizer do HybridChunker reaproveita a conversão já feita.
+O diretório é limitado em tamanho, removendo primeiro os arquivos usados há mais tempo.
+"""
+import os
+import io
+import gzip
+import time
+import hashlib
+from pathlib import Path
+from importlib import metadata
+
+from docling.document_converter import DocumentConverter, DocumentStream
+from docling_core.types.doc import DoclingDocument
+
+CACHE_DIR = os.getenv("DOCLING_CACHE_DIR", ".cache/docling")
+CACHE_MAX_BYTES = int(os.getenv("DOCLING_CACHE_MAX_MB", "4096")) * 1024 * 1024
+
+# Idade a partir da qual um arquivo temporário é considerado abandonado (segundos)
+TMP_MAX_AGE = 3600
+
+def options_fingerprint(converter: DocumentConverter) -> str:
+    """
+    Representação estável das opções que afetam a conversão.
+    """
+    parts = [f"docling={metadata.version('docling')}", f"docling-core={metadata.version('docling-core')}"]
+
+    for fmt, option in sorted(converter.format_to_options.items(), key=lambda item: str(item[0])):
+        pipeline_options = option.pipeline_options
+        options_json = pipeline_options.model_dump_json() if pipeline_options is not None else ""
+        parts.append(f"{fmt}:{option.pipeline_cls.__name__}:{option.backend.__name__}:{options_json}")
+
+    return "\n".join(parts)
+
+def cache_key(content: bytes, converter: DocumentConverter) -> str:
+    content_hash = hashlib.sha256(content).hexdigest()
+    options_hash = hashlib.sha256(options_fingerprint(converter).encode("utf-8")).hexdigest()
+    return f"{content_hash[:32]}-{options_hash[:16]}"
+
+def evict(cache_dir: Path, max_bytes: int):
+    """
+    Remove as entradas menos recentemente usadas até o cache caber em max_bytes.
+
+    Outros processos podem remover entradas ao mesmo tempo, então arquivos que somem
+    no meio do caminho são ignorados. Temporários abandonados (processo que caiu durante
+    a escrita) são removidos depois de TMP_MAX_AGE segundos.
+    """
+    now = time.time()
+    for tmp_path in cache_dir.glob("*.tmp"):
+        try:
+            if now - tmp_path.stat().st_mtime > TMP_MAX_AGE:
+                tmp_path.unlink(missing_ok=True)
+        except FileNotFoundError:
+            continue
+
+    entries = []
+    for path in cache_dir.glob("*.json.gz"):
+        try:
+            entries.append((path, path.stat()))
+        except FileNotFoundError:
+            continue
+
+    total = sum(st.st_size for _, st in entries)
+
+    for path, st in sorted(entries, key=lambda e: e[1].st_mtime):
+        if total <= max_bytes:
+            break
+        path.unlink(missing_ok=True)
+        total -= st.st_size
+
+def convert_cached(
+    converter: DocumentConverter,
+    content: bytes,
+    name: str,
+    cache_dir: str = CACHE_DIR,
+    max_bytes: int = CACHE_MAX_BYTES
+) -> DoclingDocument:
+    """
+    Converte o arquivo (bytes) com o converter, reaproveitando o resultado do cache quando existir.
+    """
+    cache_dir = Path(cache_dir)
+    path = cache_dir / f"{cache_key(content, converter)}.json.gz"
+
+    if path.exists():
+        try:
+            with gzip.open(path, "rt", encoding="utf-8") as f:
+                document = DoclingDocument.model_validate_json(f.read())
+            # Atualiza o mtime para a política LRU (a entrada pode ter sido removida por outro processo)
+            try:
+                os.utime(path)
+            except OSError:
+                pass
+            return document
+        except Exception as e:
+            print(f"Erro ao ler cache {path.name}, convertendo novamente: {e}")
+            try:
+                path.unlink(missing_ok=True)
+            except OSError:
+                pass
+
+    stream = DocumentStream(name=name, stream=io.BytesIO(content))
+    document = converter.convert(stream).document
+
+    # Falhas do cache (disco cheio, diretório sem permissão) nunca fazem a conversão falhar
+    try:
+        cache_dir.mkdir(parents=True, exist_ok=True)
+
+        # Escrita atômica: outro processo nunca lê um arquivo pela metade
+        tmp_path = path.with_suffix(f".{os.getpid()}.tmp")
+        try:
+            with gzip.open(tmp_path, "wt", encoding="utf-8") as f:
+                f.write(document.model_dump_json())
+            os.replace(tmp_path, path)
+        finally:
+            tmp_path.unlink(missing_ok=True)
+
+        evict(cache_dir, max_bytes)
+    except OSError as e:
+        print(f"Erro ao gravar cache {path.name}: {e}")
+
+    return document
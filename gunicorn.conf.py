@@ -0,0 +1,20 @@
+# Configuração do gunicorn para a API (gunicorn -c gunicorn.conf.py)
+#
+# Com preload_app a aplicação é importada no master antes do fork: o modelo de embeddings
+# é carregado uma única vez e os workers compartilham essa memória via copy-on-write.
+import gc
+import os
+
+os.environ.setdefault("PRELOAD_EMBEDDING_MODEL", "1")
+# O pool de threads do onnxruntime não é herdado pelos workers após o fork
+os.environ.setdefault("EMBEDDING_THREADS", "1")
+
+wsgi_app = "app:app"
+bind = os.getenv("BIND", "0.0.0.0:8000")
+workers = int(os.getenv("WEB_CONCURRENCY", "2"))
+worker_class = "uvicorn.workers.UvicornWorker"
+preload_app = True
+
+# Congela os objetos já carregados para o GC não tocar (e copiar) as páginas compartilhadas
+def when_ready(server):
+    gc.freeze()
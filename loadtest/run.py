@@ -0,0 +1,149 @@
+"""
+Teste de carga offline da API /ask.
+
+Roda a aplicação FastAPI em processo (httpx + ASGITransport), com o LLM, o Supabase e o
+modelo de embeddings substituídos pelos stubs de loadtest/stubs.py. Não usa rede.
+
+Uso:
+    python -m loadtest.run --requests 200 --concurrency 20 --llm-latency 0.5 --output-tokens 200
+
+Um lag alto do event loop indica chamadas bloqueantes no caminho da requisição.
+Com --max-loop-lag-ms, --max-p95-ms e --max-errors o comando sai com código 1 quando um
+limite é excedido, para uso no CI.
+"""
+import sys
+import time
+import asyncio
+import argparse
+import statistics
+from typing import List
+
+import httpx
+
+import app as api
+from agent import agent_pydantic
+from loadtest.stubs import TOOL_ERROR_PREFIX, HashEmbedding, LocalReportStore, StubStats, stub_model
+
+def percentile(values: List[float], pct: float) -> float:
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, max(0, round(pct / 100 * len(ordered)) - 1))
+    return ordered[index]
+
+async def monitor_loop_lag(interval: float, lags: List[float], stop: asyncio.Event):
+    """
+    Mede o atraso entre o tempo esperado e o real de um sleep curto no event loop.
+    """
+    while not stop.is_set():
+        start = time.perf_counter()
+        await asyncio.sleep(interval)
+        lags.append(max(0.0, time.perf_counter() - start - interval))
+
+async def run_load(args) -> dict:
+    store = LocalReportStore(n_chunks=args.chunks, latency=args.db_latency)
+    embedding_model = HashEmbedding(latency=args.embed_latency)
+
+    stats = StubStats()
+    model = stub_model(args.llm_latency, args.output_tokens, metrics_ratio=args.metrics_ratio, stats=stats)
+
+    # Substitui os modelos (embeddings e LLM) antes do lifespan carregá-los
+    agent_pydantic.get_embedding_model = lambda: embedding_model
+    agent_pydantic.build_model = lambda openai_client: model
+
+    application = api.create_app(
+        deps_factory=lambda: agent_pydantic.CRMAgentDeps(supabase=store, openai_client=None)
+    )
+
+    latencies: List[float] = []
+    errors = 0
+    lags: List[float] = []
+    stop = asyncio.Event()
+    semaphore = asyncio.Semaphore(args.concurrency)
+
+    async def one_request(client: httpx.AsyncClient, i: int):
+        nonlocal errors
+        async with semaphore:
+            start = time.perf_counter()
+            response = await client.post("/ask", json={"query": f"Pergunta de carga {i % 50}"})
+            latencies.append(time.perf_counter() - start)
+            if response.status_code != 200:
+                errors += 1
+                return
+
+            # Erros das ferramentas chegam como resposta "Erro: ..." do stub
+            body = response.json()
+            if "error" in body or str(body.get("answer", "")).startswith(TOOL_ERROR_PREFIX):
+                errors += 1
+
+    with agent_pydantic.crm_expert_agent.override(model=model):
+        async with application.router.lifespan_context(application):
+            transport = httpx.ASGITransport(app=application)
+            async with httpx.AsyncClient(transport=transport, base_url="http://loadtest", timeout=None) as client:
+                monitor = asyncio.create_task(monitor_loop_lag(args.lag_interval, lags, stop))
+
+                start = time.perf_counter()
+                await asyncio.gather(*(one_request(client, i) for i in range(args.requests)))
+                elapsed = time.perf_counter() - start
+
+                stop.set()
+                await monitor
+
+    return {
+        "requests": args.requests,
+        "concurrency": args.concurrency,
+        "errors": errors,
+        "tool_calls": stats.tool_calls,
+        "tool_errors": stats.tool_errors,
+        "elapsed": elapsed,
+        "throughput": args.requests / elapsed,
+        "latency": {p: percentile(latencies, p) for p in (50, 90, 95, 99)},
+        "latency_mean": statistics.mean(latencies),
+        "loop_lag_max": max(lags, default=0.0),
+        "loop_lag_p99": percentile(lags, 99),
+    }
+
+def print_report(report: dict):
+    print(f"Requisições: {report['requests']}  concorrência: {report['concurrency']}  erros: {report['errors']}")
+    print(f"Chamadas de ferramentas: {report['tool_calls']}  erros de ferramentas: {report['tool_errors']}")
+    print(f"Tempo total: {report['elapsed']:.2f} s  throughput: {report['throughput']:.1f} req/s")
+    latency = "  ".join(f"p{p}={v * 1000:.0f} ms" for p, v in report["latency"].items())
+    print(f"Latência: média={report['latency_mean'] * 1000:.0f} ms  {latency}")
+    print(f"Lag do event loop: p99={report['loop_lag_p99'] * 1000:.1f} ms  máx={report['loop_lag_max'] * 1000:.1f} ms")
+
+def check_thresholds(report: dict, args) -> List[str]:
+    violations = []
+    if report["errors"] > args.max_errors:
+        violations.append(f"{report['errors']} requisições com erro (máximo {args.max_errors})")
+    if args.max_p95_ms is not None and report["latency"][95] * 1000 > args.max_p95_ms:
+        violations.append(f"latência p95 {report['latency'][95] * 1000:.0f} ms (máximo {args.max_p95_ms:.0f} ms)")
+    if args.max_loop_lag_ms is not None and report["loop_lag_p99"] * 1000 > args.max_loop_lag_ms:
+        violations.append(f"lag p99 do event loop {report['loop_lag_p99'] * 1000:.1f} ms (máximo {args.max_loop_lag_ms:.0f} ms)")
+    return violations
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--requests", type=int, default=200, help="total de requisições")
+    parser.add_argument("--concurrency", type=int, default=20, help="requisições simultâneas")
+    parser.add_argument("--llm-latency", type=float, default=0.5, help="latência simulada por chamada ao LLM (s)")
+    parser.add_argument("--output-tokens", type=int, default=200, help="tokens na resposta simulada")
+    parser.add_argument("--db-latency", type=float, default=0.05, help="latência simulada do match_reports_crm (s)")
+    parser.add_argument("--embed-latency", type=float, default=0.02, help="tempo simulado do embedding da query (s)")
+    parser.add_argument("--chunks", type=int, default=500, help="chunks no vector store local")
+    parser.add_argument("--lag-interval", type=float, default=0.01, help="intervalo do monitor de lag (s)")
+    parser.add_argument("--metrics-ratio", type=float, default=0.3, help="fração das perguntas que usa query_crm_metrics")
+    parser.add_argument("--max-loop-lag-ms", type=float, default=None, help="limite para o p99 do lag do event loop")
+    parser.add_argument("--max-p95-ms", type=float, default=None, help="limite para o p95 da latência")
+    parser.add_argument("--max-errors", type=int, default=0, help="máximo de requisições com erro")
+    args = parser.parse_args()
+
+    report = asyncio.run(run_load(args))
+    print_report(report)
+
+    violations = check_thresholds(report, args)
+    for violation in violations:
+        print(f"FALHA: {violation}")
+    sys.exit(1 if violations else 0)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,230 @@
+"""
+Substitutos locais e determinísticos para o teste de carga da API (sem rede).
+
+- stub_model: modelo que chama uma ferramenta (RAG ou métricas) e depois responde com N tokens
+- LocalReportStore: substitui o client Supabase, implementando as RPCs usadas pelo agente em memória
+- HashEmbedding: substitui o modelo fastembed com embeddings derivados de hash
+"""
+import time
+import json
+import zlib
+import asyncio
+import hashlib
+import unicodedata
+from dataclasses import dataclass
+from datetime import date
+from types import SimpleNamespace
+from typing import Any, Dict, List
+
+import numpy as np
+from pydantic_ai.messages import ModelMessage, ModelResponse, TextPart, ToolCallPart, ToolReturnPart
+from pydantic_ai.models.function import AgentInfo, FunctionModel
+
+EMBEDDING_DIM = 768
+
+# Prefixo das respostas de erro das ferramentas do agente
+TOOL_ERROR_PREFIX = "Erro:"
+
+@dataclass
+class StubStats:
+    tool_calls: int = 0
+    tool_errors: int = 0
+
+def uses_metrics_tool(user_query: str, metrics_ratio: float) -> bool:
+    # Escolha determinística por pergunta, para execuções reproduzíveis
+    return zlib.crc32(user_query.encode("utf-8")) % 100 < metrics_ratio * 100
+
+def stub_model(latency: float, output_tokens: int, metrics_ratio: float = 0.0, stats: StubStats = None) -> FunctionModel:
+    """
+    Simula o LLM: a primeira chamada pede uma ferramenta (query_crm_metrics em uma fração
+    `metrics_ratio` das perguntas, retrieve_relevant_reports nas demais) e a segunda devolve a resposta.
+    Se a ferramenta retornar erro, a resposta também começa com "Erro:" e o erro é contado em `stats`.
+    Cada chamada espera `latency` segundos (sem bloquear o event loop).
+    """
+    stats = stats if stats is not None else StubStats()
+    answer = " ".join(f"token{i}" for i in range(output_tokens))
+
+    async def respond(messages: List[ModelMessage], info: AgentInfo) -> ModelResponse:
+        await asyncio.sleep(latency)
+
+        last_parts = messages[-1].parts
+        tool_returns = [part for part in last_parts if isinstance(part, ToolReturnPart)]
+        if tool_returns:
+            stats.tool_calls += len(tool_returns)
+            errors = [part for part in tool_returns if str(part.content).startswith(TOOL_ERROR_PREFIX)]
+            if errors:
+                stats.tool_errors += len(errors)
+                return ModelResponse(parts=[TextPart(content=f"{TOOL_ERROR_PREFIX} {errors[0].tool_name}: {errors[0].content}")])
+            return ModelResponse(parts=[TextPart(content=answer)])
+
+        user_query = next(
+            (part.content for part in last_parts if part.part_kind == 'user-prompt'),
+            ""
+        )
+        if uses_metrics_tool(user_query, metrics_ratio):
+            call = ToolCallPart(tool_name="query_crm_metrics", args={"metric": "vendas", "group_by": "period"})
+        else:
+            call = ToolCallPart(tool_name="retrieve_relevant_reports", args={"user_query": user_query})
+        return ModelResponse(parts=[call])
+
+    return FunctionModel(respond, model_name="stub")
+
+def hash_embedding(text: str) -> np.ndarray:
+    seed = int.from_bytes(hashlib.sha256(text.encode("utf-8")).digest()[:8], "little")
+    vector = np.random.default_rng(seed).standard_normal(EMBEDDING_DIM).astype(np.float32)
+    return vector / np.linalg.norm(vector)
+
+class HashEmbedding:
+    """
+    Mesma interface usada de fastembed.TextEmbedding; `latency` simula o custo da inferência.
+    """
+    def __init__(self, latency: float = 0.0):
+        self.latency = latency
+
+    def passage_embed(self, texts: List[str]):
+        for text in texts:
+            if self.latency:
+                time.sleep(self.latency)
+            yield hash_embedding(text)
+
+def normalize_label(value: str) -> str:
+    nfkd = unicodedata.normalize("NFKD", value.lower())
+    return "".join(c for c in nfkd if not unicodedata.combining(c))
+
+AGGREGATIONS = {
+    "sum": sum,
+    "avg": lambda values: sum(values) / len(values),
+    "min": min,
+    "max": max,
+    "count": len,
+}
+
+class LocalReportStore:
+    """
+    Client Supabase mínimo: supabase.rpc(nome, params).execute(), com match_reports_crm,
+    list_crm_metrics e aggregate_crm_metrics em memória (mesma semântica das funções SQL).
+    A chamada é síncrona como no client real; `latency` simula a ida ao banco.
+    """
+    METRICS = ["Vendas - Valor", "Vendas - Quantidade", "Negociações - Ganhas", "Negociações - Perdidas"]
+    DIMENSIONS = ["Vendedor A", "Vendedor B", "Vendedor C", "Vendedor D", "Total"]
+
+    def __init__(self, n_chunks: int = 500, n_sources: int = 24, latency: float = 0.0):
+        self.latency = latency
+        self.records: List[Dict[str, Any]] = []
+
+        for i in range(n_chunks):
+            year, month = 2021 + (i % n_sources) // 12, (i % n_sources) % 12 + 1
+            content = f"Relatório {year}.{month:02d} - trecho {i}: negociações, vendas e funil. " * 20
+            self.records.append({
+                "id": f"chunk-{i}",
+                "content": content,
+                "metadata": {
+                    "source": f"{year}.{month:02d} - RelatorioMensal.pdf",
+                    "chunk_index": i // n_sources
+                },
+            })
+
+        self.embeddings = np.stack([hash_embedding(r["content"]) for r in self.records])
+
+        self.metrics: List[Dict[str, Any]] = []
+        for i in range(n_sources):
+            period = date(2021 + i // 12, i % 12 + 1, 1)
+            for m, metric in enumerate(self.METRICS):
+                values = [float((i + 1) * (m + 1) * (d + 1)) for d in range(len(self.DIMENSIONS) - 1)]
+                for dimension, value in zip(self.DIMENSIONS, values + [sum(values)]):
+                    self.metrics.append({
+                        "period": period,
+                        "granularity": "mensal",
+                        "metric": metric,
+                        "metric_key": normalize_label(metric),
+                        "dimension": dimension,
+                        "dimension_key": normalize_label(dimension),
+                        "is_total": dimension == "Total",
+                        "value": value,
+                        "unit": "R$" if metric == "Vendas - Valor" else None,
+                    })
+
+    def rpc(self, name: str, params: Dict[str, Any]):
+        handlers = {
+            "match_reports_crm": self._match,
+            "list_crm_metrics": self._list_metrics,
+            "aggregate_crm_metrics": self._aggregate_metrics,
+        }
+        if name not in handlers:
+            raise ValueError(f"RPC não suportada no teste de carga: {name}")
+        return SimpleNamespace(execute=lambda: self._execute(handlers[name], params))
+
+    def _execute(self, handler, params: Dict[str, Any]):
+        if self.latency:
+            time.sleep(self.latency)
+        return SimpleNamespace(data=handler(params))
+
+    def _match(self, params: Dict[str, Any]) -> List[Dict[str, Any]]:
+        query = np.asarray(params["query_embedding"], dtype=np.float32)
+        similarity = self.embeddings @ query
+        top = np.argsort(-similarity)[:params.get("match_count", 3)]
+
+        # Mesmo formato do PostgREST: vector como string
+        return [
+            {**self.records[i],
+             "embedding": json.dumps(self.embeddings[i].tolist()),
+             "similarity": float(similarity[i])}
+            for i in top
+        ]
+
+    def _list_metrics(self, params: Dict[str, Any]) -> List[Dict[str, Any]]:
+        granularity = params.get("granularity_filter", "mensal")
+        groups: Dict[str, List[Dict[str, Any]]] = {}
+        for row in self.metrics:
+            if granularity is None or row["granularity"] == granularity:
+                groups.setdefault(row["metric"], []).append(row)
+
+        return [
+            {"metric": metric,
+             "unit": max((r["unit"] for r in rows if r["unit"]), default=None),
+             "first_period": min(r["period"] for r in rows).isoformat(),
+             "last_period": max(r["period"] for r in rows).isoformat(),
+             "n": len(rows)}
+            for metric, rows in sorted(groups.items())
+        ]
+
+    def _aggregate_metrics(self, params: Dict[str, Any]) -> List[Dict[str, Any]]:
+        metric_pattern = normalize_label(params["metric_pattern"])
+        dimension_pattern = params.get("dimension_pattern")
+        dimension_pattern = normalize_label(dimension_pattern) if dimension_pattern else None
+        period_start = params.get("period_start")
+        period_end = params.get("period_end")
+        granularity = params.get("granularity_filter", "mensal")
+        group_by = params.get("group_by", "period")
+        aggregate = AGGREGATIONS.get(params.get("aggregation", "sum"), sum)
+
+        groups: Dict[tuple, List[float]] = {}
+        for row in self.metrics:
+            if metric_pattern not in row["metric_key"]:
+                continue
+            if dimension_pattern and dimension_pattern not in row["dimension_key"]:
+                continue
+            if period_start and row["period"] < date.fromisoformat(period_start):
+                continue
+            if period_end and row["period"] > date.fromisoformat(period_end):
+                continue
+            if granularity is not None and row["granularity"] != granularity:
+                continue
+            if row["is_total"] and not params.get("include_totals", False):
+                continue
+
+            key = (
+                row["period"] if group_by in ("period", "period_dimension") else None,
+                row["metric"],
+                row["dimension"] if group_by in ("dimension", "period_dimension") else None,
+            )
+            groups.setdefault(key, []).append(row["value"])
+
+        return [
+            {"period": period.isoformat() if period else None,
+             "metric": metric,
+             "dimension": dimension,
+             "value": aggregate(values),
+             "n": len(values)}
+            for (period, metric, dimension), values in sorted(groups.items(), key=lambda g: tuple(str(k) for k in g[0]))
+        ]
@@ -1,5 +1,5 @@
 import asyncio
-from agent.agent_pydantic import crm_expert_agent, init_deps
+from agent.agent_pydantic import crm_expert_agent, init_deps, build_model
 
 async def main():
     # Inicializar dependências
@@ -12,7 +12,7 @@ async def main():
     print(pergunta)
 
     # Rodar o agente com a query
-    resposta = await crm_expert_agent.run(pergunta, deps=deps)
+    resposta = await crm_expert_agent.run(pergunta, model=build_model(deps.openai_client), deps=deps)
 
     print("\n🤖 Resposta do agente:")
     print(resposta)
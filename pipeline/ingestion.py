@@ -1,18 +1,22 @@
 import os
-import io
+import re
 import uuid
+import math
+import unicodedata
 import requests
 import pandas as pd
 from typing import List, Dict, Any
-from datetime import datetime
+from datetime import datetime, date
 
-from docling.document_converter import DocumentConverter, DocumentStream
+from docling.document_converter import DocumentConverter
 from docling.chunking import HybridChunker
 from docling_core.transforms.chunker.tokenizer.huggingface import HuggingFaceTokenizer
+from docling_core.types.doc import DocItemLabel, TableItem
 from transformers import AutoTokenizer
 from fastembed import TextEmbedding
 
 from clients import new_supabase_client, get_access_token
+from docling_cache import convert_cached
 
 from dotenv import load_dotenv
 
@@ -81,12 +85,8 @@ def extract_files_sharepoint(site_name, folder_path):
 def convert_doc(pdf_bytes):
     converter = DocumentConverter()
 
-    stream = io.BytesIO(pdf_bytes)
-
-    doc_stream = DocumentStream(stream=stream, file_type='pdf', name='temp.pdf')
-
-    result = converter.convert(doc_stream)
-    return result.document
+    # Reaproveita a conversão do cache em disco quando o PDF e as opções não mudaram
+    return convert_cached(converter, pdf_bytes, name='temp.pdf')
 
 def create_document_chunks(document, embed_model_id: str, max_tokens: int):
     
@@ -122,6 +122,132 @@ def build_records(file_name: str, chunks: List[Dict[str, Any]], embeddings: List
         records.append(record)
     return records
 
+# Período do relatório a partir do nome do arquivo (AAAA.MM para mensal, AAAA.MM.DD para semanal)
+PERIOD_RE = re.compile(r'(?P<year>\d{4})\.(?P<month>\d{2})(?:\.(?P<day>\d{2}))?')
+
+def parse_report_period(file_name: str):
+    m = PERIOD_RE.search(file_name)
+    if not m:
+        return None, None
+
+    day = m.group('day')
+    period = date(int(m.group('year')), int(m.group('month')), int(day) if day else 1)
+    granularity = 'semanal' if day else 'mensal'
+    return period, granularity
+
+def clean_label(value: Any) -> str:
+    return re.sub(r'\s+', ' ', str(value)).strip()
+
+# Forma normalizada (minúsculas, sem acentos) usada nos filtros e no índice trigram do Supabase
+def normalize_label(value: str) -> str:
+    nfkd = unicodedata.normalize("NFKD", value.lower())
+    return "".join(c for c in nfkd if not unicodedata.combining(c))
+
+# Linhas de total/subtotal não são uma dimensão: somá-las com as demais duplicaria os valores
+TOTAL_RE = re.compile(r'^(sub)?\s*total\b')
+
+def parse_number(value: Any):
+    """
+    Converte valores das tabelas (formato pt-BR, ex.: "R$ 1.234,56", "12,5%") em (valor, unidade).
+    """
+    if isinstance(value, (int, float)):
+        return (None, None) if math.isnan(value) else (float(value), None)
+
+    text = str(value).strip()
+    unit = 'R$' if 'R$' in text else '%' if text.endswith('%') else None
+    text = text.replace('R$', '').replace('%', '').replace('\xa0', '').replace(' ', '')
+
+    if not re.fullmatch(r'[-+]?\d[\d.,]*', text):
+        return None, None
+
+    if ',' in text:
+        text = text.replace('.', '').replace(',', '.')
+    elif re.fullmatch(r'[-+]?\d{1,3}(\.\d{3})+', text):
+        text = text.replace('.', '')
+
+    try:
+        return float(text), unit
+    except ValueError:
+        return None, None
+
+def table_titles(document) -> Dict[str, str]:
+    """
+    Título de cada tabela: a legenda, ou (mais comum nos PDFs do CRM) o último título/cabeçalho
+    de seção que aparece antes dela na ordem de leitura.
+    """
+    titles = {}
+    current = ""
+    for item, _ in document.iterate_items():
+        if item.label in (DocItemLabel.SECTION_HEADER, DocItemLabel.TITLE):
+            current = clean_label(item.text)
+        elif isinstance(item, TableItem):
+            titles[item.self_ref] = clean_label(item.caption_text(document)) or current
+    return titles
+
+def extract_table_metrics(document, file_name: str) -> List[Dict[str, Any]]:
+    """
+    Normaliza as tabelas do DoclingDocument em registros (período, métrica, dimensão, valor).
+
+    A primeira coluna de cada tabela é usada como dimensão (vendedor, etapa do funil, motivo de perda...)
+    e cada coluna numérica vira uma métrica identificada por "<título da tabela> - <coluna> por <dimensão>",
+    para que colunas homônimas ("Quantidade", "Valor") de tabelas diferentes não sejam somadas juntas.
+    Tabelas sem título são ignoradas. Linhas de total/subtotal são marcadas com is_total.
+    """
+    period, granularity = parse_report_period(file_name)
+    titles = table_titles(document)
+
+    records = []
+    for table_index, table in enumerate(document.tables):
+        df = table.export_to_dataframe(doc=document)
+        if df.empty or len(df.columns) < 2:
+            continue
+
+        title = titles.get(table.self_ref, "")
+        if not title:
+            print(f"Tabela {table_index} de {file_name} sem título, métricas ignoradas")
+            continue
+
+        dimension_col, *value_cols = df.columns
+
+        # Cabeçalho da coluna de dimensão (ex.: "Motivo de perda", "Etapa"); colunas sem cabeçalho vêm numeradas
+        dimension_name = clean_label(dimension_col)
+        if dimension_name.isdigit():
+            dimension_name = ""
+
+        for _, row in df.iterrows():
+            dimension = clean_label(row[dimension_col])
+            dimension_key = normalize_label(dimension)
+
+            for col in value_cols:
+                value, unit = parse_number(row[col])
+                if value is None:
+                    continue
+
+                metric = f"{title} - {clean_label(col)}"
+                if dimension_name:
+                    metric = f"{metric} por {dimension_name}"
+
+                records.append({
+                    "id": str(uuid.uuid4()),
+                    "source": file_name,
+                    "period": period.isoformat() if period else None,
+                    "granularity": granularity,
+                    "table_index": table_index,
+                    "metric": metric,
+                    "metric_key": normalize_label(metric),
+                    "dimension": dimension,
+                    "dimension_key": dimension_key,
+                    "is_total": bool(TOTAL_RE.match(dimension_key)),
+                    "value": value,
+                    "unit": unit
+                })
+    return records
+
+def delete_metrics(source: str, table_name: str = "crm_metrics"):
+    supabase = new_supabase_client()
+    result = supabase.table(table_name).delete().eq("source", source).execute()
+    return result
+
 def insert_records(records: List[Dict[str, Any]], table_name: str = "reports_crm"):
     supabase = new_supabase_client()
     result = supabase.table(table_name).insert(records).execute()
@@ -143,6 +269,12 @@ def ingest_files(site_name: str, folder_path: str, model_name: str, max_tokens:
         records = build_records(file_name, chunks, embeddings)
         insert_records(records=records)
 
+        # Re-ingestão de um relatório substitui as métricas dele em vez de duplicá-las
+        metrics = extract_table_metrics(doc, file_name)
+        delete_metrics(source=file_name)
+        if metrics:
+            insert_records(records=metrics, table_name="crm_metrics")
+
     return files_process
 
 def main():
@@ -14,19 +14,104 @@ create index on reports_crm
 using ivfflat (embedding vector_l2_ops) with (lists = 100);
 
 -- Função de busca semântica
+-- Retorna também o embedding para a deduplicação/MMR na montagem do contexto
+drop function if exists match_reports_crm(vector, int);
+
 create or replace function match_reports_crm(
   query_embedding vector(768),
   match_count int default 3
 )
-returns table(id uuid, content text, metadata jsonb, similarity float)
+returns table(id uuid, content text, metadata jsonb, embedding vector, similarity float)
 language sql stable as $$
   select
     id,
     content,
     metadata,
+    embedding,
     1 - (embedding <=> query_embedding) as similarity
   from reports_crm
   where embedding is not null
   order by embedding <-> query_embedding
   limit match_count;
 $$;
+
+-- Métricas extraídas das tabelas dos relatórios (período, métrica, dimensão, valor)
+create extension if not exists unaccent;
+create extension if not exists pg_trgm;
+
+create table crm_metrics (
+  id uuid primary key,
+  source text,
+  period date,
+  granularity text, -- 'mensal' ou 'semanal'
+  table_index int,
+  metric text,
+  metric_key text, -- métrica em minúsculas e sem acentos (normalizada na ingestão)
+  dimension text,
+  dimension_key text,
+  is_total boolean default false, -- linhas "Total"/"Subtotal" das tabelas
+  value numeric,
+  unit text
+);
+
+create index on crm_metrics (source);
+create index on crm_metrics (granularity, period);
+-- Índices trigram para os filtros like '%...%' por métrica e dimensão
+create index on crm_metrics using gin (metric_key gin_trgm_ops);
+create index on crm_metrics using gin (dimension_key gin_trgm_ops);
+
+-- Lista as métricas disponíveis
+create or replace function list_crm_metrics(
+  granularity_filter text default 'mensal'
+)
+returns table(metric text, unit text, first_period date, last_period date, n bigint)
+language sql stable as $$
+  select
+    m.metric,
+    max(m.unit) as unit,
+    min(m.period) as first_period,
+    max(m.period) as last_period,
+    count(*) as n
+  from crm_metrics m
+  where granularity_filter is null or m.granularity = granularity_filter
+  group by m.metric
+  order by m.metric;
+$$;
+
+-- Consulta agregada de métricas (totais, médias, tendências)
+-- Linhas de total das tabelas ficam de fora por padrão para não somar valores duas vezes
+create or replace function aggregate_crm_metrics(
+  metric_pattern text,
+  dimension_pattern text default null,
+  period_start date default null,
+  period_end date default null,
+  granularity_filter text default 'mensal',
+  aggregation text default 'sum', -- sum | avg | min | max | count
+  group_by text default 'period', -- period | dimension | period_dimension | total
+  include_totals boolean default false
+)
+returns table(period date, metric text, dimension text, value numeric, n bigint)
+language sql stable as $$
+  select
+    case when group_by in ('period', 'period_dimension') then m.period end,
+    m.metric,
+    case when group_by in ('dimension', 'period_dimension') then m.dimension end,
+    case lower(aggregation)
+      when 'avg' then avg(m.value)
+      when 'min' then min(m.value)
+      when 'max' then max(m.value)
+      when 'count' then count(*)::numeric
+      else sum(m.value)
+    end,
+    count(*)
+  from crm_metrics m
+  where m.metric_key like '%' || unaccent(lower(metric_pattern)) || '%'
+    and (dimension_pattern is null
+         or m.dimension_key like '%' || unaccent(lower(dimension_pattern)) || '%')
+    and (period_start is null or m.period >= period_start)
+    and (period_end is null or m.period <= period_end)
+    and (granularity_filter is null or m.granularity = granularity_filter)
+    and (include_totals or not m.is_total)
+  group by 1, 2, 3
+  order by 1 nulls first, 2, 3;
+$$;
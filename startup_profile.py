@@ -0,0 +1,77 @@
+"""
+Mede o tempo de importação de app.py (e o RSS do processo após o import) e a memória
+(RSS/PSS) por worker do gunicorn.
+
+Uso:
+    python startup_profile.py import [--runs 5]
+    python startup_profile.py memory <pid do master do gunicorn>
+
+PSS divide as páginas compartilhadas entre os processos, então mostra o ganho do
+preload melhor que o RSS.
+"""
+import sys
+import argparse
+import statistics
+import subprocess
+
+IMPORT_SNIPPET = (
+    "import time, resource; t = time.perf_counter(); import app; "
+    "print(time.perf_counter() - t, resource.getrusage(resource.RUSAGE_SELF).ru_maxrss)"
+)
+
+def measure_import(runs: int):
+    timings, peaks = [], []
+    for _ in range(runs):
+        out = subprocess.run(
+            [sys.executable, "-c", IMPORT_SNIPPET],
+            capture_output=True, text=True, check=True
+        )
+        elapsed, max_rss_kb = out.stdout.strip().splitlines()[-1].split()
+        timings.append(float(elapsed))
+        peaks.append(int(max_rss_kb))
+
+    print(f"import app: mediana {statistics.median(timings) * 1000:.0f} ms "
+          f"(min {min(timings) * 1000:.0f} ms, max {max(timings) * 1000:.0f} ms, {runs} execuções)")
+    print(f"RSS máximo do processo após o import: {statistics.median(peaks) / 1024:.0f} MB")
+
+def read_kb(path: str, field: str) -> int:
+    with open(path) as f:
+        for line in f:
+            if line.startswith(field + ":"):
+                return int(line.split()[1])
+    return 0
+
+def children(pid: int):
+    with open(f"/proc/{pid}/task/{pid}/children") as f:
+        return [int(p) for p in f.read().split()]
+
+def measure_memory(master_pid: int):
+    print(f"{'pid':>8} {'RSS (MB)':>10} {'PSS (MB)':>10}")
+    total_pss = 0
+    for pid in [master_pid] + children(master_pid):
+        rss = read_kb(f"/proc/{pid}/status", "VmRSS")
+        pss = read_kb(f"/proc/{pid}/smaps_rollup", "Pss")
+        total_pss += pss
+        label = " (master)" if pid == master_pid else ""
+        print(f"{pid:>8} {rss / 1024:>10.0f} {pss / 1024:>10.0f}{label}")
+    print(f"PSS total: {total_pss / 1024:.0f} MB")
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    p_import = sub.add_parser("import")
+    p_import.add_argument("--runs", type=int, default=5)
+
+    p_memory = sub.add_parser("memory")
+    p_memory.add_argument("pid", type=int)
+
+    args = parser.parse_args()
+
+    if args.command == "import":
+        measure_import(args.runs)
+    else:
+        measure_memory(args.pid)
+
+if __name__ == "__main__":
+    main()
@@ -1,103 +1,165 @@
 from __future__ import annotations
-import os
+import queue
 import asyncio
-import json
-from typing import Literal, TypedDict
+import threading
+from typing import List, Literal, Optional, Tuple, TypedDict
 import streamlit as st
 
-from agent.agent_pydantic import crm_expert_agent, CRMAgentDeps
+from agent.agent_pydantic import crm_expert_agent, CRMAgentDeps, init_deps, get_embedding_model, build_model, llm
+from agent.context import load_tokenizer
 from pydantic_ai.messages import (
     ModelMessage,
     ModelRequest,
     ModelResponse,
-    SystemPromptPart,
     UserPromptPart,
-    TextPart,
-    ToolCallPart,
-    ToolReturnPart,
-    RetryPromptPart,
-    ModelMessagesTypeAdapter
 )
 
-import clients
+# Recursos compartilhados entre reruns e sessões (criados uma única vez por processo)
+@st.cache_resource(show_spinner=False)
+def get_deps() -> CRMAgentDeps:
+    return init_deps()
 
-# Configuração dos Clients
-openai_client = clients.new_client_openai()
+@st.cache_resource(show_spinner=False)
+def get_model():
+    return build_model(get_deps().openai_client)
 
-supabase = clients.new_supabase_client()
+@st.cache_resource(show_spinner="Carregando modelo de embeddings e tokenizer...")
+def load_models():
+    load_tokenizer(llm)
+    return get_embedding_model()
+
+# Event loop único rodando em background; as execuções do agente são submetidas a ele
+@st.cache_resource(show_spinner=False)
+def get_event_loop() -> asyncio.AbstractEventLoop:
+    loop = asyncio.new_event_loop()
+    threading.Thread(target=loop.run_forever, name='agent-event-loop', daemon=True).start()
+    return loop
 
 class ChatMessage(TypedDict):
     role: Literal['user', 'model']
     timestamp: str
     content: str
 
-def display_message(part):
+# Marca de fim do stream na fila de chunks
+STREAM_END = object()
+
+# Máximo de mensagens exibidas dentro do fragmento antes de movê-las para o histórico estático
+FRAGMENT_MAX_ITEMS = 10
+
+def display_item(part) -> Optional[Tuple[str, str]]:
     # system-prompt
     if part.part_kind == 'system-prompt':
-        with st.chat_message('system'):
-            st.markdown(f'**System**: {part.content}')
+        return 'system', f'**System**: {part.content}'
     # user-prompt
     elif part.part_kind == 'user-prompt':
-        with st.chat_message('user'):
-            st.markdown(part.content)
+        return 'user', part.content
     # text
     elif part.part_kind == 'text':
-        with st.chat_message('assistant'):
-            st.markdown(part.content)
+        return 'assistant', part.content
+    return None
+
+def to_display_items(messages: List[ModelMessage]) -> List[Tuple[str, str]]:
+    items = []
+    for msg in messages:
+        if isinstance(msg, ModelRequest) or isinstance(msg, ModelResponse):
+            for part in msg.parts:
+                item = display_item(part)
+                if item:
+                    items.append(item)
+    return items
 
-async def run_agent_with_streaming(user_input: str):
-    # Inicializar as dependências
-    deps = CRMAgentDeps(
-        supabase=supabase,
-        openai_client=openai_client
+def display_messages(items: List[Tuple[str, str]]):
+    for role, content in items:
+        with st.chat_message(role):
+            st.markdown(content)
+
+async def run_agent_with_streaming(user_input: str, model, deps: CRMAgentDeps, message_history: List[ModelMessage], chunks: queue.Queue):
+    try:
+        # Executa agent em stream
+        async with crm_expert_agent.run_stream(
+            user_input,
+            model=model,
+            deps=deps,
+            message_history=message_history
+        ) as result:
+            async for chunk in result.stream_text(delta=True):
+                chunks.put(chunk)
+
+            # Filtra as mensagens novas (a pergunta do usuário já está no histórico)
+            return [msg for msg in result.new_messages()
+                    if not (hasattr(msg, 'parts') and
+                            any(part.part_kind == 'user-prompt' for part in msg.parts))]
+    finally:
+        chunks.put(STREAM_END)
+
+def stream_agent_response(user_input: str) -> List[ModelMessage]:
+    chunks: queue.Queue = queue.Queue()
+    future = asyncio.run_coroutine_threadsafe(
+        run_agent_with_streaming(user_input, get_model(), get_deps(), st.session_state.messages[:-1], chunks),
+        get_event_loop()
     )
 
-    # Executa agent em stream
-    async with crm_expert_agent.run_stream(
-        user_input,
-        deps=deps,
-        message_history=st.session_state.messages[:-1]
-    ) as result:
-        partial_text = ''
-        message_placeholder = st.empty()
-
-        # Renderiza o texto conforme ele chega
-        async for chunk in result.stream_text(delta=True):
+    # Renderiza o texto conforme ele chega (na thread do script do Streamlit)
+    partial_text = ''
+    message_placeholder = st.empty()
+    finished = False
+    try:
+        while (chunk := chunks.get()) is not STREAM_END:
             partial_text += chunk
             message_placeholder.markdown(partial_text)
+        finished = True
+    finally:
+        # Stop/rerun durante o stream interrompe o script: cancela a execução no loop compartilhado
+        if not finished:
+            future.cancel()
 
-        # Filtra as mensagens e adiciona no histórico da sessão
-        filtered_messages = [msg for msg in result.new_messages()
-                             if not (hasattr(msg, 'parts') and
-                                     any(part.part_kind == 'user-prompt' for part in msg.parts))]
-        
-        st.session_state.messages.extend(filtered_messages)
+    return future.result()
 
-async def main():
-    st.title('CRM Agentic RAG')
-    st.write('Faça perguntas sobre os relatórios do CRM.')
+# A cada pergunta somente este fragmento roda, exibindo as mensagens desde o último rerun completo.
+# Quando elas passam de FRAGMENT_MAX_ITEMS, um rerun completo (scope="app") as move para o
+# histórico estático, então o custo de cada pergunta não cresce com o tamanho da conversa.
+# Limitação: o rerun completo (ao carregar a página e a cada FRAGMENT_MAX_ITEMS mensagens)
+# ainda renderiza o histórico inteiro.
+@st.fragment
+def chat():
+    display_messages(st.session_state.display_items[st.session_state.rendered_upto:])
 
-    # Inicializa o histórico de mensagens caso ele não exista
-    if 'messages' not in st.session_state:
-        st.session_state.messages = []
-    
-    for msg in st.session_state.messages:
-        if isinstance(msg, ModelRequest) or isinstance(msg, ModelResponse):
-            for part in msg.parts:
-                display_message(part=part)
-    
     user_input = st.chat_input("Faça sua pergunta aqui...")
 
     if user_input:
         st.session_state.messages.append(
             ModelRequest(parts=[UserPromptPart(content=user_input)])
         )
+        st.session_state.display_items.append(('user', user_input))
 
         with st.chat_message('user'):
             st.markdown(user_input)
-        
+
         with st.chat_message('assistant'):
-            await run_agent_with_streaming(user_input=user_input)
+            new_messages = stream_agent_response(user_input=user_input)
+
+        st.session_state.messages.extend(new_messages)
+        st.session_state.display_items.extend(to_display_items(new_messages))
+
+        if len(st.session_state.display_items) - st.session_state.rendered_upto > FRAGMENT_MAX_ITEMS:
+            st.rerun(scope="app")
+
+def main():
+    st.title('CRM Agentic RAG')
+    st.write('Faça perguntas sobre os relatórios do CRM.')
+
+    load_models()
+
+    # Inicializa o histórico de mensagens caso ele não exista
+    if 'messages' not in st.session_state:
+        st.session_state.messages = []
+        st.session_state.display_items = []
+
+    # Rerun completo: renderiza o histórico já convertido e marca até onde foi exibido
+    st.session_state.rendered_upto = len(st.session_state.display_items)
+    display_messages(st.session_state.display_items)
+
+    chat()
 
 if __name__ == '__main__':
-    asyncio.run(main=main())
\ No newline at end of file
+    main()
@@ -1,12 +1,13 @@
-import io
 import logging
 import re
 from collections import defaultdict
 from pathlib import Path
-from docling.document_converter import DocumentConverter, DocumentStream, PdfFormatOption
+from docling.document_converter import DocumentConverter, PdfFormatOption
 from docling.datamodel.base_models import InputFormat
 from docling.datamodel.pipeline_options import PdfPipelineOptions
 
+from docling_cache import convert_cached
+
 def process_pdf_in_memory(pdf_bytes: bytes, file_name: str, output_dir: Path):
     """
     Converte e exporta imagens/markdown/HTML de um PDF em memória (bytes).
@@ -25,18 +26,13 @@ def process_pdf_in_memory(pdf_bytes: bytes, file_name: str, output_dir: Path):
         }
     )
 
-    doc_stream = DocumentStream(
-        name=file_name,
-        media_type="application/pdf",
-        stream=io.BytesIO(pdf_bytes)
-    )
-
-    conv_res = doc_converter.convert(doc_stream)
+    # As imagens das páginas são serializadas junto com o documento no cache
+    document = convert_cached(doc_converter, pdf_bytes, name=file_name)
 
     output_dir.mkdir(parents=True, exist_ok=True)
     doc_filename = Path(file_name).stem
 
-    for page_no, page in conv_res.document.pages.items():
+    for page_no, page in document.pages.items():
         page_no = page.page_no
         page_image_filename = output_dir / f"{doc_filename}-{page_no}.png"
         with page_image_filename.open("wb") as fp:
@@ -64,8 +60,8 @@ def images_to_markdown(images_dir: str, output_dir: str):
         items.sort(key=lambda t: t[0])
         parts = []
         for _, fpath in items:
-            result = converter.convert(str(fpath))
-            parts.append(result.document.export_to_markdown())
+            document = convert_cached(converter, fpath.read_bytes(), name=fpath.name)
+            parts.append(document.export_to_markdown())
         out_path = output_dir / f"{prefix}.md"
         out_path.write_text("\n\n".join(parts), encoding="utf-8")
         print(f"✅ {prefix} -> {out_path}")
\ No newline at end of file